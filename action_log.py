@@ -0,0 +1,93 @@
+'''
+action_log.py
+~~~
+Compact per-generation log of a flappy bird NEAT run.
+
+A generation is fully determined by the course seed and the frames at
+which each bird jumped, so that is all that is stored: no networks and
+no rendered frames. replay.py re-simulates a generation from its log.
+
+On disk a log is gzipped JSON with the jump frames delta-encoded.
+'''
+
+
+# Import libraries
+import gzip
+import json
+import os
+
+
+# Create classes
+
+## Action log of one generation
+class ActionLog():
+
+    VERSION = 1
+
+    def __init__(self, generation, seed, genome_ids):
+        self.generation = generation
+        self.seed = seed
+        self.genome_ids = list(genome_ids)
+        self.jumps = [[] for _ in self.genome_ids]      # frame indices
+        self.deaths = [None for _ in self.genome_ids]   # frame index, None if alive at the end
+        self.frames = 0
+        self.score = 0
+
+    def record_jump(self, index, frame):
+        self.jumps[index].append(frame)
+
+    def record_death(self, index, frame):
+        self.deaths[index] = frame
+
+    def finish(self, frames, score):
+        self.frames = frames
+        self.score = score
+
+    def to_dict(self):
+        deltas = []
+        for frames in self.jumps:
+            prev = 0
+            row = []
+            for f in frames:
+                row.append(f - prev)
+                prev = f
+            deltas.append(row)
+        return {"version": self.VERSION,
+                "generation": self.generation,
+                "seed": self.seed,
+                "genome_ids": self.genome_ids,
+                "jumps": deltas,
+                "deaths": self.deaths,
+                "frames": self.frames,
+                "score": self.score}
+
+    @classmethod
+    def from_dict(cls, data):
+        if data.get("version") != cls.VERSION:
+            raise ValueError("Unsupported action log version: {!r}".format(data.get("version")))
+        log = cls(data["generation"], data["seed"], data["genome_ids"])
+        for row, deltas in zip(log.jumps, data["jumps"]):
+            frame = 0
+            for d in deltas:
+                frame += d
+                row.append(frame)
+        log.deaths = list(data["deaths"])
+        log.frames = data["frames"]
+        log.score = data["score"]
+        return log
+
+    def save(self, path):
+        with gzip.open(path, "wt") as f:
+            json.dump(self.to_dict(), f, separators=(",", ":"))
+
+    @classmethod
+    def load(cls, path):
+        with gzip.open(path, "rt") as f:
+            return cls.from_dict(json.load(f))
+
+
+# Define functions
+
+## File name of a generation's log inside a log directory
+def log_path(directory, generation):
+    return os.path.join(directory, "gen_{:05d}.json.gz".format(generation))
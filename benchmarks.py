@@ -0,0 +1,252 @@
+'''
+benchmarks.py
+~~~
+Micro-benchmarks for the flappy bird game and its NEAT helpers.
+
+Run from the repository root, e.g.:
+
+    python benchmarks.py draw
+'''
+
+
+# Import libraries
+import os
+import pickle
+import random
+import sys
+import tempfile
+import time
+
+# Allow running without a display
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+import neat
+import numpy as np
+import pygame
+import flappy_bird_NEAT as game
+import flappy_env
+import netcompile
+
+
+# Define functions
+
+## Full-window redraw, as draw_window worked before the dirty-rect renderer
+def legacy_draw_window(win, birds, pipes, base, score, gen, pipe_ind):
+    win.blit(game.bg_img, (0,0))
+    for pipe in pipes:
+        pipe.draw(win)
+    base.draw(win)
+
+    for bird in birds:
+        bird.draw(win)
+        if game.DRAW_LINES:
+            try:
+                pygame.draw.line(win, (255,0,0),
+                                 (bird.x + bird.img.get_width()//2,
+                                  bird.y + bird.img.get_height()//2),
+                                 (pipes[pipe_ind].x + pipes[pipe_ind].PIPE_TOP.get_width()//2,
+                                  pipes[pipe_ind].height),
+                                 5)
+                pygame.draw.line(win, (255,0,0),
+                                 (bird.x + bird.img.get_width()//2,
+                                  bird.y + bird.img.get_height()//2),
+                                 (pipes[pipe_ind].x + pipes[pipe_ind].PIPE_BOTTOM.get_width()//2,
+                                  pipes[pipe_ind].bottom),
+                                 5)
+            except:
+                pass
+
+    for text, pos in (("Score: " + str(score), None),
+                      ("Gens: " + str(gen-1), (10,10)),
+                      ("Alive: " + str(len(birds)), (10,50))):
+        label = game.STAT_FONT.render(text, 1, (255,255,255))
+        if pos is None:
+            pos = (game.WIN_WIDTH - label.get_width()-15, 10)
+        win.blit(label, pos)
+
+    pygame.display.update()
+
+
+## Time one draw function over a simulated run of frames
+def time_frames(draw, n_birds, frames):
+    birds = [game.Bird(game.WIN_WIDTH//4, game.WIN_HEIGHT//2 + (i % 50))
+             for i in range(n_birds)]
+    pipes = [game.Pipe(game.WIN_WIDTH)]
+    base = game.Base(game.FLOOR)
+
+    start = time.perf_counter()
+    for frame in range(frames):
+        for i, bird in enumerate(birds):
+            if (frame + i) % 12 == 0:
+                bird.jump()
+            bird.move()
+            bird.y = min(max(bird.y, 0), game.FLOOR - 40)
+        base.move()
+        for pipe in pipes:
+            pipe.move()
+        if pipes[-1].x < game.WIN_WIDTH // 2:
+            pipes.append(game.Pipe(game.WIN_WIDTH))
+        pipes = [p for p in pipes if p.x + p.PIPE_TOP.get_width() >= 0]
+        draw(game.get_window(), birds, pipes, base, frame // 40, 2, 0)
+    return (time.perf_counter() - start) / frames
+
+
+## Compare the legacy and dirty-rect renderers
+def bench_draw(frames=200):
+    print("{:>6} {:>12} {:>12} {:>8}".format("birds", "legacy ms", "dirty ms", "speedup"))
+    for n_birds in (10, 100, 1000):
+        legacy = time_frames(legacy_draw_window, n_birds, frames)
+        game.renderer = None
+        dirty = time_frames(game.draw_window, n_birds, frames)
+        print("{:>6} {:>12.3f} {:>12.3f} {:>7.2f}x".format(
+            n_birds, legacy * 1000, dirty * 1000, legacy / dirty))
+
+
+## Load the NEAT config shipped with the game
+def load_config():
+    local_dir = os.path.dirname(os.path.abspath(__file__))
+    return neat.config.Config(neat.DefaultGenome,
+                              neat.DefaultReproduction,
+                              neat.DefaultSpeciesSet,
+                              neat.DefaultStagnation,
+                              os.path.join(local_dir, 'config-feedforward.txt'))
+
+
+## Random observations in the range the game produces
+def random_observations(n, seed=0):
+    rng = random.Random(seed)
+    return [(rng.uniform(-10, game.FLOOR),
+             rng.uniform(0, game.FLOOR),
+             rng.uniform(0, game.FLOOR)) for _ in range(n)]
+
+
+## Random multi-layer networks for the parity check
+def random_networks(n, seed=0):
+    ''' FeedForwardNetworks built directly, with hidden layers, mixed
+    activation and aggregation functions and a second output that is
+    sometimes never evaluated. Mutating genomes under this config only
+    gives tanh/sum networks of 0-1 nodes. '''
+    rng = random.Random(seed)
+    activations = neat.activations.ActivationFunctionSet()
+    aggregations = neat.aggregations.AggregationFunctionSet()
+    # Functions that stay finite on game-sized inputs over a few layers
+    act_names = ["sigmoid", "tanh", "sin", "gauss", "relu", "softplus",
+                 "identity", "clamped", "abs", "hat"]
+    agg_names = ["sum", "product", "max", "min", "maxabs", "median", "mean"]
+    inputs, outputs = [-1, -2, -3], [0, 1]
+
+    def node_eval(node, available):
+        links = [(k, rng.uniform(-1, 1)) for k in rng.sample(available, rng.randint(1, 3))]
+        return (node, activations.get(rng.choice(act_names)), aggregations.get(rng.choice(agg_names)),
+                rng.uniform(-1, 1), rng.uniform(0.5, 1.5), links)
+
+    nets = []
+    for _ in range(n):
+        node_evals = []
+        available = list(inputs)
+        for _ in range(rng.randint(1, 3)):
+            layer = [len(node_evals) + 2 + i for i in range(rng.randint(1, 4))]
+            node_evals.extend(node_eval(node, available) for node in layer)
+            available += layer
+        node_evals.extend(node_eval(node, available) for node in outputs[:rng.randint(1, 2)])
+        nets.append(neat.nn.FeedForwardNetwork(inputs, outputs, node_evals))
+    return nets
+
+
+## Check compiled networks against FeedForwardNetwork.activate
+def check_parity(nets, observations):
+    ''' Checks the compiled function exactly, and the batch function on an
+    (n, 3) array and on each observation as a (1, 3) array, against
+    activate. numpy's exp/tanh may differ from math's in the last bits. '''
+    batch = np.array(observations, dtype=float)
+    for net in nets:
+        compiled = netcompile.compile_network(net)
+        compiled_batch = netcompile.compile_batch_network(net)
+        expected = [net.activate(obs) for obs in observations]
+        for obs, want in zip(observations, expected):
+            got = compiled(obs)
+            if got != want:
+                raise AssertionError("compiled {} != activate {} for {}".format(got, want, obs))
+            got = np.array(compiled_batch(np.array([obs], dtype=float))).T
+            if got.shape != (1, len(want)) or not np.allclose(got[0], want, rtol=1e-12, atol=1e-12):
+                raise AssertionError("batch {} != activate {} for {}".format(got[0].tolist(), want, obs))
+        got = np.array(compiled_batch(batch)).T
+        if got.shape != (len(expected), len(net.output_nodes)) or \
+                not np.allclose(got, expected, rtol=1e-12, atol=1e-12):
+            raise AssertionError("batch != activate on {} observations".format(len(observations)))
+
+
+## Per-decision latency of activate vs the compiled function
+def bench_activate(decisions=100000):
+    nets = [pickle.load(open("best_pickle", "rb"))]
+    nets += random_networks(100)
+    observations = random_observations(1000)
+
+    check_parity(nets, observations)
+    print("parity ok on {} networks x {} observations".format(len(nets), len(observations)))
+
+    print("{:>10} {:>8} {:>12} {:>12} {:>8}".format("network", "nodes", "activate us", "compiled us", "speedup"))
+    for name, net in (("champion", nets[0]), ("random", max(nets[1:], key=lambda n: len(n.node_evals)))):
+        compiled = netcompile.compile_network(net)
+        timings = []
+        for func in (net.activate, compiled):
+            start = time.perf_counter()
+            for i in range(decisions):
+                func(observations[i % 1000])
+            timings.append((time.perf_counter() - start) / decisions)
+        print("{:>10} {:>8} {:>12.3f} {:>12.3f} {:>7.2f}x".format(
+            name, len(net.node_evals), timings[0] * 1e6, timings[1] * 1e6, timings[0] / timings[1]))
+
+    start = time.perf_counter()
+    netcompile.clear_cache()
+    for net in nets:
+        netcompile.compile_network(net)
+    print("compile: {:.1f} us per network".format((time.perf_counter() - start) / len(nets) * 1e6))
+
+
+## Bird-frames per second of the vectorized environment
+def bench_env(frames=1000):
+    net = pickle.load(open("best_pickle", "rb"))
+    activate = netcompile.compile_batch_network(net)
+    print("{:>6} {:>16}".format("envs", "bird-frames/s"))
+    for n_envs in (1, 100, 1000, 10000):
+        env = flappy_env.FlappyVecEnv(n_envs, seed=0)
+        obs = env.reset()
+        start = time.perf_counter()
+        for _ in range(frames):
+            obs, _, _, _ = env.step(activate(obs)[0] > 0.5)
+        elapsed = time.perf_counter() - start
+        print("{:>6} {:>16.0f}".format(n_envs, n_envs * frames / elapsed))
+
+
+## Peak and retained memory of real generations
+def bench_alloc(generations=3, pop_size=100):
+    config = load_config()
+    config.pop_size = pop_size
+    config.fitness_threshold = float("inf")
+    population = neat.Population(config)
+    game.FPS = 0
+    game.TRACE_MEMORY = True
+    # eval_genomes saves best_pickle; keep the shipped one intact
+    cwd = os.getcwd()
+    os.chdir(tempfile.mkdtemp())
+    try:
+        population.run(game.eval_genomes, generations)
+    finally:
+        os.chdir(cwd)
+        game.TRACE_MEMORY = False
+        game.FPS = 30
+
+
+BENCHMARKS = {
+    "draw": bench_draw,
+    "activate": bench_activate,
+    "env": bench_env,
+    "alloc": bench_alloc,
+}
+
+if __name__ == '__main__':
+    names = sys.argv[1:] or list(BENCHMARKS)
+    for name in names:
+        print("== " + name)
+        BENCHMARKS[name]()
@@ -16,6 +16,9 @@ import time
 import neat
 import visualize
 import pickle
+import tracemalloc
+import action_log
+import stats_store
 
 # Initialize pygame and pygame fonts
 pygame.init()
@@ -25,17 +28,37 @@ WIN_WIDTH = 282
 WIN_HEIGHT = 512
 FLOOR = WIN_HEIGHT - 112
 BG_VEL = 3
+FPS = 30                # 0 runs as fast as possible
 STAT_FONT = pygame.font.SysFont("comicsans", 25)
 END_FONT = pygame.font.SysFont("comicsans", 35)
 DRAW_LINES = True
+DRAW = True             # False simulates without drawing the window
+TRACE_MEMORY = False    # print peak and retained memory per generation
+RECORD_DIR = None       # directory for per-generation action logs (see replay.py)
+STATS_DIR = "stats"     # per-generation statistics and champions (see stats_store.py)
+LIVE_PLOT = False       # plot fitness and speciation live, in a background process
+METRICS_PORT = None     # serve live metrics on localhost at this port (see metrics.py)
+FRAME_HOOK = None       # called once per frame, e.g. by sweep.py to enforce a time budget
+EVAL_STATS_EVERY = 30   # frames between eval_stats updates during a generation
 
 # Restart generation counter
 gen = 0 
 
+# Window renderer, created on the first draw
+renderer = None
 
-# Load main window
-WIN = pygame.display.set_mode( (WIN_WIDTH, WIN_HEIGHT) )
-pygame.display.set_caption("Flappy Bird")
+# Pipe heights come from here, seeded per generation so runs can be replayed
+course_rng = random.Random()
+
+# Timings of the generation being evaluated, or of the last one. Replaced as a
+# whole every EVAL_STATS_EVERY frames and when the generation ends
+eval_stats = {}
+
+
+# Main window, opened by get_window() on the first draw. Importing the
+# module opens no window, e.g. when multiprocessing's spawn re-imports it
+# in the LivePlot process
+WIN = None
 
 # Load images
 pipe_img = pygame.image.load(os.path.join("imgs", "pipe.png"))
@@ -45,6 +68,12 @@ bird_images = [
     for x in range(1,4) ]
 base_img = pygame.image.load(os.path.join("imgs", "base.png"))
 
+# Shared sprite resources, built once instead of per object
+pipe_top_img = pygame.transform.flip(pipe_img, False, True)
+pipe_top_mask = pygame.mask.from_surface(pipe_top_img)
+pipe_bottom_mask = pygame.mask.from_surface(pipe_img)
+bird_masks = {img: pygame.mask.from_surface(img) for img in bird_images}
+
 
 
 # Create classes
@@ -52,6 +81,9 @@ base_img = pygame.image.load(os.path.join("imgs", "base.png"))
 ## Bird
 class Bird:
 
+    __slots__ = ("x", "y", "tilt", "tick_count", "vel", "height",
+                 "img_count", "img")
+
     ### Variables
     MAX_ROTATION = 25
     IMGS = bird_images
@@ -93,7 +125,7 @@ class Bird:
             if self.tilt > -90:
                 self.tilt -= self.ROT_VEL
 
-    def draw(self, win):
+    def animate(self):
         self.img_count += 1
 
         ### For animation of bird, loop through three images
@@ -114,19 +146,40 @@ class Bird:
             self.img = self.IMGS[1]
             self.img_count = self.ANIMATION_TIME*2
 
+    def draw(self, win):
+        # The frame also picks the collision mask, see get_mask
+        self.animate()
+
         # tilt the bird
-        blitRotateCenter(win, self.img, (self.x, self.y), self.tilt)
+        return blitRotateCenter(win, self.img, (self.x, self.y), self.tilt)
 
     def get_mask(self):
         # Find the actual pixels fo the bird image
-        return pygame.mask.from_surface(self.img)
+        return bird_masks[self.img]
 
 
 ## Pipe
 class Pipe():
+
+    __slots__ = ("x", "height", "top", "bottom", "passed")
+
+    ### Define variables
     GAP = 100
+    PIPE_TOP = pipe_top_img
+    PIPE_BOTTOM = pipe_img
+    TOP_MASK = pipe_top_mask
+    BOTTOM_MASK = pipe_bottom_mask
+
+    ### Pipes that scrolled off screen, ready for reuse
+    pool = []
+    created = 0
+    reused = 0
 
     def __init__(self, x):
+        Pipe.created += 1
+        self.reset(x)
+
+    def reset(self, x):
         self.x = x
         self.height = 0
 
@@ -134,17 +187,27 @@ class Pipe():
         self.top = 0
         self.bottom = 0
 
-        self.PIPE_TOP = pygame.transform.flip(pipe_img, False, True)
-        self.PIPE_BOTTOM = pipe_img
-
         # Index function for if bird passed the pipe 
         self.passed = False
 
         # Set the height of the pipe 
         self.set_height()
 
+    @classmethod
+    def spawn(cls, x):
+        # Reuse a released pipe if there is one
+        if cls.pool:
+            cls.reused += 1
+            pipe = cls.pool.pop()
+            pipe.reset(x)
+            return pipe
+        return cls(x)
+
+    def release(self):
+        Pipe.pool.append(self)
+
     def set_height(self):
-        self.height = random.randrange(50, FLOOR-self.GAP-50)
+        self.height = course_rng.randrange(50, FLOOR-self.GAP-50)
         self.top = self.height - self.PIPE_TOP.get_height()
         self.bottom = self.height + self.GAP
 
@@ -153,14 +216,15 @@ class Pipe():
 
     def draw(self, win):
         # draw top
-        win.blit(self.PIPE_TOP, (self.x, self.top))
+        top_rect = win.blit(self.PIPE_TOP, (self.x, self.top))
         # draw bottom
-        win.blit(self.PIPE_BOTTOM, (self.x, self.bottom)) 
+        bottom_rect = win.blit(self.PIPE_BOTTOM, (self.x, self.bottom))
+        return top_rect, bottom_rect
 
     def collide(self, bird, win):
         bird_mask = bird.get_mask()
-        top_mask = pygame.mask.from_surface(self.PIPE_TOP)
-        bottom_mask = pygame.mask.from_surface(self.PIPE_BOTTOM)
+        top_mask = self.TOP_MASK
+        bottom_mask = self.BOTTOM_MASK
         top_offset = (self.x - bird.x, self.top - round(bird.y))
         bottom_offset = (self.x - bird.x, self.bottom - round(bird.y))
         
@@ -196,8 +260,9 @@ class Base():
             self.x2 = self.x1 + self.WIDTH
 
     def draw(self, win):
-        win.blit(self.IMG, (self.x1, self.y))
-        win.blit(self.IMG, (self.x2, self.y)) 
+        rect1 = win.blit(self.IMG, (self.x1, self.y))
+        rect2 = win.blit(self.IMG, (self.x2, self.y))
+        return rect1, rect2
 
 
 
@@ -208,73 +273,190 @@ class Base():
 def blitRotateCenter(surf, image, topleft, angle):
     rotated_image = pygame.transform.rotate(image, angle)
     new_rect = rotated_image.get_rect(center = image.get_rect(topleft = topleft).center)
-    surf.blit(rotated_image, new_rect.topleft)
+    return surf.blit(rotated_image, new_rect.topleft)
 
     
+## Window renderer
+class Renderer():
+    """ Redraws only the parts of the window that changed since the
+    last frame.
+
+    The static background is composited once and used to erase the
+    rectangles that were drawn on the previous frame. HUD labels are
+    re-rendered only when their text changes. """
+
+    ### Define variables
+    TEXT_COLOR = (255,255,255)
+    MAX_DIRTY_RECTS = 100   # above this a full repaint is cheaper
+
+    def __init__(self, win):
+        self.win = win
+        self.background = bg_img.convert()
+        self.labels = {}
+        self.prev_rects = []
+        self.full_redraw = True
+
+    def reset(self):
+        # Force the next frame to repaint the whole window
+        self.full_redraw = True
+        self.prev_rects = []
+
+    def label(self, slot, text):
+        # Cache one rendered surface per HUD slot until its text changes
+        cached = self.labels.get(slot)
+        if cached is None or cached[0] != text:
+            cached = (text, STAT_FONT.render(text, 1, self.TEXT_COLOR))
+            self.labels[slot] = cached
+        return cached[1]
+
+    def draw(self, birds, pipes, base, score, gen, pipe_ind):
+        win = self.win
+        rects = []
+
+        ### Erase what was drawn last frame
+        if self.full_redraw or len(self.prev_rects) > self.MAX_DIRTY_RECTS:
+            win.blit(self.background, (0,0))
+        else:
+            for rect in self.prev_rects:
+                win.blit(self.background, rect, rect)
+
+        ### Draw pipes
+        for pipe in pipes:
+            rects.extend(pipe.draw(win))
+        ### Draw the base
+        rects.extend(base.draw(win))
+
+        ### Draw the birds
+        for bird in birds:
+            # Draw the bird
+            rects.append(bird.draw(win))
+
+            # draw lines from bird to pipe
+            if DRAW_LINES and pipe_ind < len(pipes):
+                pipe = pipes[pipe_ind]
+                center = (bird.x + bird.img.get_width()//2,
+                          bird.y + bird.img.get_height()//2)
+                rects.append(pygame.draw.line(win,
+                                              (255,0,0),
+                                              center,
+                                              (pipe.x + pipe.PIPE_TOP.get_width()//2,
+                                               pipe.height),
+                                              5))
+                rects.append(pygame.draw.line(win,
+                                              (255,0,0),
+                                              center,
+                                              (pipe.x + pipe.PIPE_BOTTOM.get_width()//2,
+                                               pipe.bottom),
+                                              5))
+
+        ### Score
+        label = self.label("score", "Score: " + str(score))
+        rects.append(win.blit(label, (WIN_WIDTH - label.get_width()-15, 10)))
+
+        ### generations
+        label = self.label("gen", "Gens: " + str(gen-1))
+        rects.append(win.blit(label, (10,10)))
+
+        ### alive
+        label = self.label("alive", "Alive: " + str(len(birds)))
+        rects.append(win.blit(label, (10,50)))
+
+        ### Update the display
+        if self.full_redraw or len(self.prev_rects) + len(rects) > self.MAX_DIRTY_RECTS:
+            pygame.display.update()
+            self.full_redraw = False
+        else:
+            pygame.display.update(self.prev_rects + rects)
+        self.prev_rects = rects
+
+
+## Open the main window on first use
+def get_window():
+    global WIN
+    if WIN is None:
+        WIN = pygame.display.set_mode( (WIN_WIDTH, WIN_HEIGHT) )
+        pygame.display.set_caption("Flappy Bird")
+    return WIN
+
+
 ## Draw Window
 def draw_window(win, birds, pipes, base, score, gen, pipe_ind):
+    global renderer
 
     ### Initial gen setting
     if gen == 0:
         gen = 1
-        
-    ### Draw the background
-    win.blit(bg_img, (0,0))
-    ### Draw pipes
+
+    if renderer is None or renderer.win is not win:
+        renderer = Renderer(win)
+
+    renderer.draw(birds, pipes, base, score, gen, pipe_ind)
+
+    
+## Choose the pipe the birds aim at
+def pipe_index(birds, pipes):
+    pipe_ind = 0
+    if len(birds) > 0:
+        # determine whether to use the first or second pipe
+        # on screeen for the NN input
+        if len(pipes) > 1 and birds[0].x > pipes[0].x + pipes[0].PIPE_TOP.get_width(): 
+            pipe_ind = 1
+    return pipe_ind
+
+
+## Move the pipes, returns True if a pipe was passed
+def move_pipes(birds, pipes, remove_bird):
+    rem=[]
+    add_pipe = False
     for pipe in pipes:
-        pipe.draw(win)
-    ### Draw the base
-    base.draw(win) 
+        pipe.move()
 
-    ### Draw the birds
-    for bird in birds:
-        # Draw the bird
-        bird.draw(win)
-        
-        # draw lines from bird to pipe
-        if DRAW_LINES:
-            try:
-                pygame.draw.line(win,
-                                 (255,0,0),
-                                 (bird.x + bird.img.get_width()//2,
-                                   bird.y + bird.img.get_height()//2),
-                                 (pipes[pipe_ind].x + pipes[pipe_ind].PIPE_TOP.get_width()//2,
-                                   pipes[pipe_ind].height),
-                                 5)
-                pygame.draw.line(win,
-                                 (255,0,0),
-                                 (bird.x + bird.img.get_width()//2,
-                                   bird.y + bird.img.get_height()//2),
-                                 (pipes[pipe_ind].x + pipes[pipe_ind].PIPE_BOTTOM.get_width()//2,
-                                   pipes[pipe_ind].bottom),
-                                 5)
-            except:
-                pass
+        # Check for collision
+        for bird in birds:
+            if pipe.collide(bird, WIN):
+                remove_bird(bird, True)
 
-            
-    ### Score
-    score_label = STAT_FONT.render("Score: " + str(score), 1,
-                                   (255,255,255))
-    win.blit(score_label, (WIN_WIDTH - score_label.get_width()-15, 10))
+        # Check if pipe is off of screen 
+        if pipe.x + pipe.PIPE_TOP.get_width() < 0:
+            rem.append(pipe)
 
-    ### generations
-    score_label = STAT_FONT.render("Gens: " + str(gen-1), 1,
-                                   (255,255,255))
-    win.blit(score_label, (10,10))
+        # Check if pipe was passed
+        if not pipe.passed and pipe.x < bird.x:
+            pipe.passed = True
+            add_pipe = True
 
-    ### alive
-    score_label = STAT_FONT.render("Alive: " + str(len(birds)), 1,
-                                   (255,255,255))
-    win.blit(score_label, (10,50))
+    for r in rem:
+        pipes.remove(r)
+        r.release()
+
+    return add_pipe
+
+
+## Remove birds that hit the floor or flew off the top
+def remove_offscreen(birds, remove_bird):
+    for bird in birds:
+        if bird.y + bird.img.get_height()-10 >= FLOOR or bird.y < -10:
+            remove_bird(bird, False)
 
-    ### Update the display
-    pygame.display.update()
 
-    
 ## evaluate the genomes (previously main) 
 def eval_genomes(genomes, config):
     global WIN, WIN_WIDTH, WIN_HEIGHT, gen
     gen += 1
+    eval_start = time.perf_counter()
+
+    if TRACE_MEMORY:
+        tracemalloc.start()
+        pipes_created = Pipe.created
+        pipes_reused = Pipe.reused
+
+    ### Seed the course for this generation
+    seed = random.randrange(2**32)
+    course_rng.seed(seed)
+    log = None
+    if RECORD_DIR is not None:
+        log = action_log.ActionLog(gen, seed, [genome_id for genome_id, genome in genomes])
+        log_index = {}
 
     ### Create list holders for NNs, birds, genomes 
     nets = []
@@ -287,21 +469,53 @@ def eval_genomes(genomes, config):
         nets.append(net)
         birds.append(Bird(WIN_WIDTH//4, WIN_HEIGHT//2))
         ge.append(genome) 
+        if log is not None:
+            log_index[id(genome)] = len(log_index)
 
     ### Create base
     base = Base(FLOOR)
     ### Create pipes
-    pipes = [Pipe(WIN_WIDTH)]
+    pipes = [Pipe.spawn(WIN_WIDTH)]
     ### Create score
     score = 0
+    frame = 0
+    bird_frames = 0
+    phases = {"setup": time.perf_counter() - eval_start,
+              "wait": 0.0, "think": 0.0, "world": 0.0, "draw": 0.0}
+
+    def publish_stats(running):
+        # A new dict each time, so readers never see a partial update
+        global eval_stats
+        eval_stats = {"generation": gen,
+                      "running": running,
+                      "seconds": time.perf_counter() - eval_start,
+                      "frames": frame,
+                      "bird_frames": bird_frames,
+                      "score": score,
+                      "phases": dict(phases)}
+
+    def remove_bird(bird, crashed):
+        i = birds.index(bird)
+        if crashed:
+            ge[i].fitness -= 1
+        if log is not None:
+            log.record_death(log_index[id(ge[i])], frame)
+        nets.pop(i)
+        ge.pop(i)
+        birds.pop(i)
     
     ### Create clock
     clock = pygame.time.Clock()
 
+    ### Repaint the whole window on the first frame
+    if renderer is not None:
+        renderer.reset()
+
     ### Main loop
     run = True
     while run and len(birds) > 0:
-        clock.tick(30)
+        t0 = time.perf_counter()
+        clock.tick(FPS)
        
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
@@ -310,12 +524,12 @@ def eval_genomes(genomes, config):
                 quit()
                 break 
 
-        pipe_ind = 0
-        if len(birds) > 0:
-            # determine whether to use the first or second pipe
-            # on screeen for the NN input
-            if len(pipes) > 1 and birds[0].x > pipes[0].x + pipes[0].PIPE_TOP.get_width(): 
-                pipe_ind = 1
+        if FRAME_HOOK is not None:
+            FRAME_HOOK()
+
+        t1 = time.perf_counter()
+        pipe_ind = pipe_index(birds, pipes)
+        bird_frames += len(birds)
 
         # increment bird fitness for every frame that it survives
         for x, bird in enumerate(birds):
@@ -331,59 +545,70 @@ def eval_genomes(genomes, config):
             # Jump if over 0. 5
             if output[0] > 0.5:
                 bird.jump()
+                if log is not None:
+                    log.record_jump(log_index[id(ge[x])], frame)
             
+        t2 = time.perf_counter()
         # Move the base
         base.move()
 
-        
         # Move the pipes
-        rem=[]
-        add_pipe = False
-        for pipe in pipes:
-            pipe.move()
-
-            # Check for collision
-            for bird in birds:
-                if pipe.collide(bird, WIN):
-                    ge[birds.index(bird)].fitness -= 1
-                    nets.pop(birds.index(bird))
-                    ge.pop(birds.index(bird))
-                    birds.pop(birds.index(bird))
-
-            # Check if pipe is off of screen 
-            if pipe.x + pipe.PIPE_TOP.get_width() < 0:
-                rem.append(pipe)
-
-            # Check if pipe was passed
-            if not pipe.passed and pipe.x < bird.x:
-                pipe.passed = True
-                add_pipe = True
+        add_pipe = move_pipes(birds, pipes, remove_bird)
 
         if add_pipe:
             score += 1
             # Give more reward for passing through a pipe
             for genome in ge:
                 genome.fitness += 5
-            pipes.append(Pipe(WIN_WIDTH))
+            pipes.append(Pipe.spawn(WIN_WIDTH))
 
-        for r in rem:
-            pipes.remove(r)
-
-        for bird in birds:
-            if bird.y + bird.img.get_height()-10 >= FLOOR or bird.y < -10:
-                nets.pop(birds.index(bird))
-                ge.pop(birds.index(bird))
-                birds.pop(birds.index(bird))
+        remove_offscreen(birds, remove_bird)
 
+        t3 = time.perf_counter()
         # Draw the frame 
-        draw_window(WIN, birds, pipes, base, score, gen, pipe_ind) 
+        if DRAW:
+            draw_window(get_window(), birds, pipes, base, score, gen, pipe_ind) 
+        else:
+            # Drawing animates the birds, which picks their collision masks
+            for bird in birds:
+                bird.animate()
+        frame += 1
+
+        t4 = time.perf_counter()
+        phases["wait"] += t1 - t0
+        phases["think"] += t2 - t1
+        phases["world"] += t3 - t2
+        phases["draw"] += t4 - t3
+        if frame % EVAL_STATS_EVERY == 0:
+            publish_stats(True)
 
         # Break if score gets large enough
         if score > 100:
             pickle.dump(nets[0], open("best_pickle", "wb"))
             break
 
-def run(config_file):
+    ### Return the pipes to the pool for the next generation
+    for pipe in pipes:
+        pipe.release()
+
+    publish_stats(False)
+
+    if log is not None:
+        log.finish(frame, score)
+        os.makedirs(RECORD_DIR, exist_ok=True)
+        log.save(action_log.log_path(RECORD_DIR, gen))
+
+    if TRACE_MEMORY:
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        # tracemalloc only sees blocks still alive, not every allocation made
+        blocks = sum(stat.count for stat in snapshot.statistics("filename"))
+        print("Gen {}: peak {:.1f} KiB, {} blocks ({:.1f} KiB) retained at the end, pipes created {} reused {}".format(
+            gen, peak / 1024, blocks, current / 1024,
+            Pipe.created - pipes_created, Pipe.reused - pipes_reused))
+
+def run(config_file, generations=50, reporters=()):
     config = neat.config.Config(neat.DefaultGenome,
                                 neat.DefaultReproduction,
                                 neat.DefaultSpeciesSet,
@@ -395,14 +620,37 @@ def run(config_file):
 
     # Add a stdout reporter to show progress in terminal
     p.add_reporter(neat.StdOutReporter(True))
-    stats = neat.StatisticsReporter()
+    stats = stats_store.DiskStatisticsReporter(STATS_DIR)
     p.add_reporter(stats)
 
+    # Serve live metrics
+    metrics_reporter = None
+    if METRICS_PORT is not None:
+        import metrics      # only loaded when serving metrics
+        metrics_reporter = metrics.MetricsReporter(lambda: eval_stats)
+        metrics_reporter.serve(METRICS_PORT)
+        p.add_reporter(metrics_reporter)
+
+    for reporter in reporters:
+        p.add_reporter(reporter)
+
+    # Plot the statistics as they are written
+    live_plot = None
+    if LIVE_PLOT:
+        live_plot = visualize.LivePlot(stats.store, filename="live_stats.svg").start()
+
     # Run for up to 50 generations
-    winner = p.run(eval_genomes, 50)
+    try:
+        winner = p.run(eval_genomes, generations)
+    finally:
+        if live_plot is not None:
+            live_plot.stop()
+        if metrics_reporter is not None:
+            metrics_reporter.shutdown()
 
     # Show final stats
     print('\nBest genome: \n{!s}'.format(winner))
+    return winner
 
 if __name__ == '__main__':
     local_dir = os.path.dirname(__file__)
@@ -0,0 +1,252 @@
+'''
+flappy_env.py
+~~~
+Batched step/reset environment around the flappy bird game rules.
+
+Runs N independent games, one bird each, as numpy arrays and without
+opening a window, so other optimizers and evaluation harnesses can use
+the simulation without the NEAT loop or pygame rendering:
+
+    env = FlappyVecEnv(256, seed=0)
+    obs = env.reset()
+    while True:
+        obs, rewards, dones, info = env.step(policy(obs))
+
+Observations are the same (bird.y, top_dist, bottom_dist) triples fed to
+the networks in flappy_bird_NEAT.py, and rewards follow its fitness:
++0.1 per frame alive, +5 per pipe passed and -1 for hitting a pipe.
+Instances that finish are reset automatically with a new course.
+
+Collisions use the bounding boxes of the sprite masks rather than
+per-pixel masks.
+'''
+
+
+# Import libraries
+import os
+
+import numpy as np
+import pygame
+
+import netcompile
+
+
+# Define global constants, matching flappy_bird_NEAT.py
+WIN_WIDTH = 282
+WIN_HEIGHT = 512
+FLOOR = WIN_HEIGHT - 112
+BG_VEL = 3
+
+BIRD_X = WIN_WIDTH // 4
+BIRD_START_Y = WIN_HEIGHT // 2
+JUMP_VEL = -7.2
+GRAVITY = 2.5
+TERMINAL_VEL = 8
+
+PIPE_GAP = 100
+MAX_PIPES = 2       # a new pipe spawns only after the previous one is passed
+
+
+# Sprite sizes, read from the same images the game draws
+def _sprite_boxes():
+    local_dir = os.path.dirname(os.path.abspath(__file__))
+    bird = pygame.image.load(os.path.join(local_dir, "imgs", "bird1.png"))
+    pipe = pygame.image.load(os.path.join(local_dir, "imgs", "pipe.png"))
+    bird_box = pygame.mask.from_surface(bird).get_bounding_rects()[0]
+    return bird.get_height(), tuple(bird_box), pipe.get_width(), pipe.get_height()
+
+BIRD_HEIGHT, (BIRD_BOX_X, BIRD_BOX_Y, BIRD_BOX_W, BIRD_BOX_H), PIPE_WIDTH, PIPE_HEIGHT = _sprite_boxes()
+
+
+# Create classes
+
+## Vectorized environment
+class FlappyVecEnv():
+    ''' N independent flappy bird games stepped together.
+
+    ``seed`` is either an int (instance i uses seed + i) or a sequence of
+    N seeds. Each instance draws its pipe heights from its own generator,
+    so a run is reproducible regardless of N or of the other instances.
+    ``max_score`` ends an episode once that many pipes are passed, like
+    the score > 100 cut-off in eval_genomes. '''
+
+    def __init__(self, num_envs, seed=None, max_score=100):
+        self.num_envs = num_envs
+        self.max_score = max_score
+        if seed is None or np.isscalar(seed):
+            base = np.random.SeedSequence(seed).generate_state(1)[0] if seed is None else seed
+            seeds = [base + i for i in range(num_envs)]
+        else:
+            seeds = list(seed)
+            if len(seeds) != num_envs:
+                raise ValueError("Expected {} seeds, got {}".format(num_envs, len(seeds)))
+        self.seeds = seeds
+        self.rngs = [np.random.default_rng(s) for s in seeds]
+
+        ### Bird state
+        self.y = np.zeros(num_envs)
+        self.vel = np.zeros(num_envs)
+        self.tick_count = np.zeros(num_envs, dtype=np.int64)
+
+        ### Pipe state, slot 0 is the front pipe
+        self.pipe_x = np.zeros((num_envs, MAX_PIPES))
+        self.pipe_height = np.zeros((num_envs, MAX_PIPES))
+        self.pipe_valid = np.zeros((num_envs, MAX_PIPES), dtype=bool)
+        self.pipe_passed = np.zeros((num_envs, MAX_PIPES), dtype=bool)
+
+        ### Episode state
+        self.score = np.zeros(num_envs, dtype=np.int64)
+        self.frames = np.zeros(num_envs, dtype=np.int64)
+        self.episode_return = np.zeros(num_envs)
+
+    def _new_height(self, i):
+        return self.rngs[i].integers(50, FLOOR - PIPE_GAP - 50)
+
+    def _reset_where(self, mask):
+        idx = np.flatnonzero(mask)
+        if idx.size == 0:
+            return
+        self.y[idx] = BIRD_START_Y
+        self.vel[idx] = 0
+        self.tick_count[idx] = 0
+        self.pipe_x[idx] = WIN_WIDTH
+        self.pipe_valid[idx] = False
+        self.pipe_valid[idx, 0] = True
+        self.pipe_passed[idx] = False
+        for i in idx:
+            self.pipe_height[i, 0] = self._new_height(i)
+        self.score[idx] = 0
+        self.frames[idx] = 0
+        self.episode_return[idx] = 0
+
+    def reset(self):
+        ''' Resets every instance and returns the (N, 3) observations. '''
+        self._reset_where(np.ones(self.num_envs, dtype=bool))
+        return self.observe()
+
+    def observe(self):
+        # Aim at the second pipe once the bird is past the first one
+        rows = np.arange(self.num_envs)
+        ind = (self.pipe_valid[:, 1] &
+               (BIRD_X > self.pipe_x[:, 0] + PIPE_WIDTH)).astype(np.int64)
+        height = self.pipe_height[rows, ind]
+        obs = np.empty((self.num_envs, 3))
+        obs[:, 0] = self.y
+        obs[:, 1] = np.abs(self.y - height)
+        obs[:, 2] = np.abs(self.y - (height + PIPE_GAP))
+        return obs
+
+    def step(self, actions):
+        ''' Advances every instance by one frame.
+
+        ``actions`` is a length-N array, truthy to jump. Returns
+        (observations, rewards, dones, info); ``info`` holds the final
+        ``score``, ``frames`` and ``return`` of the instances that finished
+        this step, which have already been reset. '''
+        jump = np.asarray(actions, dtype=bool)
+        rewards = np.full(self.num_envs, 0.1)
+
+        ### Move the birds
+        self.vel[jump] = JUMP_VEL
+        self.tick_count[jump] = 0
+        self.tick_count += 1
+        t = self.tick_count
+        displacement = np.minimum(self.vel * t + 0.5 * GRAVITY * t**2, TERMINAL_VEL)
+        self.y += displacement
+
+        ### Move the pipes
+        self.pipe_x[self.pipe_valid] -= BG_VEL
+
+        ### Check for collision with a pipe
+        left = BIRD_X + BIRD_BOX_X
+        top = np.round(self.y) + BIRD_BOX_Y
+        overlap_x = (self.pipe_x < left + BIRD_BOX_W) & (self.pipe_x + PIPE_WIDTH > left)
+        hit_top = top[:, None] < self.pipe_height
+        hit_bottom = top[:, None] + BIRD_BOX_H > self.pipe_height + PIPE_GAP
+        crashed = (self.pipe_valid & overlap_x & (hit_top | hit_bottom)).any(axis=1)
+        rewards[crashed] -= 1
+
+        ### Check if a pipe was passed
+        passed = self.pipe_valid & ~self.pipe_passed & (self.pipe_x < BIRD_X)
+        self.pipe_passed |= passed
+        scored = passed.any(axis=1) & ~crashed
+        self.score[scored] += 1
+        rewards[scored] += 5
+
+        ### Drop the front pipe once it is off screen
+        gone = self.pipe_valid[:, 0] & (self.pipe_x[:, 0] + PIPE_WIDTH < 0)
+        for arr in (self.pipe_x, self.pipe_height, self.pipe_valid, self.pipe_passed):
+            arr[gone, :-1] = arr[gone, 1:]
+        self.pipe_valid[gone, -1] = False
+
+        ### Spawn a new pipe behind the one just passed
+        for i in np.flatnonzero(scored):
+            slot = np.count_nonzero(self.pipe_valid[i])
+            if slot < MAX_PIPES:
+                self.pipe_x[i, slot] = WIN_WIDTH
+                self.pipe_height[i, slot] = self._new_height(i)
+                self.pipe_valid[i, slot] = True
+                self.pipe_passed[i, slot] = False
+
+        ### Check if bird still on screen
+        out = (self.y + BIRD_HEIGHT - 10 >= FLOOR) | (self.y < -10)
+        dones = crashed | out | (self.score > self.max_score)
+
+        self.frames += 1
+        self.episode_return += rewards
+        info = {}
+        if dones.any():
+            info = {"index": np.flatnonzero(dones),
+                    "score": self.score[dones].copy(),
+                    "frames": self.frames[dones].copy(),
+                    "return": self.episode_return[dones].copy()}
+            self._reset_where(dones)
+
+        return self.observe(), rewards, dones, info
+
+
+# Define functions
+
+## Run a batch of callables / networks as policies
+def evaluate(policies, seed=0, max_frames=10000):
+    ''' Plays one episode per policy on seeded courses and returns the
+    episode returns.
+
+    A policy is either a callable taking an (n, 3) array of observations
+    and returning the network outputs, one length-n array per output
+    (like netcompile.compile_batch_network), or a FeedForwardNetwork-like
+    object with ``activate``, which is compiled that way. A bird jumps
+    when its first output is over 0.5, as in eval_genomes. Policies that
+    are the same callable, or networks with the same structure, are
+    evaluated together in one call per frame. '''
+    n = len(policies)
+    env = FlappyVecEnv(n, seed=seed)
+    obs = env.reset()
+    returns = np.full(n, np.nan)
+    finished = np.zeros(n, dtype=bool)
+
+    ### Group instances by the batch function that decides for them
+    groups = {}
+    for i, policy in enumerate(policies):
+        func = netcompile.compile_batch_network(policy) if hasattr(policy, "activate") else policy
+        groups.setdefault(id(func), (func, []))[1].append(i)
+    groups = [(func, np.array(rows)) for func, rows in groups.values()]
+
+    for _ in range(max_frames):
+        actions = np.zeros(n, dtype=bool)
+        for func, rows in groups:
+            rows = rows[~finished[rows]]
+            if rows.size:
+                actions[rows] = np.asarray(func(obs[rows])[0]) > 0.5
+        obs, _, dones, info = env.step(actions)
+        if dones.any():
+            for i, ret in zip(info["index"], info["return"]):
+                if not finished[i]:
+                    returns[i] = ret
+                    finished[i] = True
+        if finished.all():
+            break
+
+    ### Episodes still running when max_frames hit
+    returns[~finished] = env.episode_return[~finished]
+    return returns
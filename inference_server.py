@@ -0,0 +1,257 @@
+'''
+inference_server.py
+~~~
+Serve jump decisions from a saved champion to many game instances.
+
+The champion (``best_pickle`` by default) is loaded once. Clients send
+``(bird.y, top_dist, bottom_dist)`` observations over localhost TCP or a
+Unix socket; requests from all clients are collected into micro-batches
+for at most ``max_delay`` seconds (or ``max_batch`` requests) and
+evaluated with one vectorized call.
+
+    python inference_server.py serve --port 5005
+    python inference_server.py load --port 5005 --clients 64
+
+Wire format, per request: three big-endian doubles. Per reply: one byte,
+1 to jump and 0 otherwise.
+'''
+
+
+# Import libraries
+import argparse
+import asyncio
+import os
+import pickle
+import random
+import socket
+import struct
+import time
+
+import numpy as np
+
+import netcompile
+
+
+# Define global constants
+REQUEST = struct.Struct("!3d")
+REPLY = struct.Struct("!B")
+JUMP_THRESHOLD = 0.5
+
+
+# Create classes
+
+## Latency / throughput counters
+class Stats():
+
+    def __init__(self, window=100000):
+        self.window = window
+        self.reset()
+
+    def reset(self):
+        self.start = time.perf_counter()
+        self.requests = 0
+        self.batches = 0
+        self.latencies = []
+
+    def record_batch(self, latencies):
+        self.requests += len(latencies)
+        self.batches += 1
+        self.latencies.extend(latencies)
+        # Keep a bounded sample for the percentiles
+        if len(self.latencies) > self.window:
+            del self.latencies[:len(self.latencies) - self.window]
+
+    def report(self):
+        elapsed = time.perf_counter() - self.start
+        if not self.latencies:
+            return "no requests"
+        lat = np.array(self.latencies) * 1e3
+        return ("{:.0f} req/s, mean batch {:.1f}, latency ms p50 {:.3f} p99 {:.3f} max {:.3f}"
+                .format(self.requests / elapsed,
+                        self.requests / max(self.batches, 1),
+                        np.percentile(lat, 50), np.percentile(lat, 99), lat.max()))
+
+
+## Micro-batching server
+class InferenceServer():
+
+    def __init__(self, net, max_batch=256, max_delay=0.002):
+        self.activate = netcompile.compile_batch_network(net)
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.stats = Stats()
+        self.pending = []
+        self.wakeup = None
+
+    def decide(self, observations):
+        ''' Jump decisions for an (n, 3) array of observations. '''
+        return self.activate(observations)[0] > JUMP_THRESHOLD
+
+    async def submit(self, observation):
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append((observation, time.perf_counter(), future))
+        if len(self.pending) == 1 or len(self.pending) >= self.max_batch:
+            self.wakeup.set()
+        return await future
+
+    async def batcher(self):
+        while True:
+            await self.wakeup.wait()
+            self.wakeup.clear()
+            if not self.pending:
+                continue
+
+            ### Wait out the latency budget unless the batch is already full
+            deadline = self.pending[0][1] + self.max_delay
+            while len(self.pending) < self.max_batch:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), remaining)
+                except asyncio.TimeoutError:
+                    break
+                self.wakeup.clear()
+
+            batch = self.pending[:self.max_batch]
+            del self.pending[:self.max_batch]
+            if self.pending:
+                self.wakeup.set()
+
+            try:
+                jumps = self.decide(np.array([obs for obs, _, _ in batch]))
+            except Exception as e:
+                # Fail this batch's requests and keep serving the others
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            now = time.perf_counter()
+            for (_, received, future), jump in zip(batch, jumps):
+                if not future.done():
+                    future.set_result(bool(jump))
+            self.stats.record_batch([now - received for _, received, _ in batch])
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                data = await reader.readexactly(REQUEST.size)
+                jump = await self.submit(REQUEST.unpack(data))
+                writer.write(REPLY.pack(jump))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except Exception as e:
+            # The protocol has no error reply; drop the connection
+            print("closing connection: {!r}".format(e), flush=True)
+        finally:
+            writer.close()
+
+    async def reporter(self, interval):
+        while True:
+            await asyncio.sleep(interval)
+            print(self.stats.report(), flush=True)
+            self.stats.reset()
+
+    async def serve(self, host="127.0.0.1", port=5005, unix=None, report_every=5.0):
+        self.wakeup = asyncio.Event()
+        if unix:
+            server = await asyncio.start_unix_server(self.handle, path=unix)
+        else:
+            server = await asyncio.start_server(self.handle, host, port)
+        tasks = [asyncio.ensure_future(self.batcher())]
+        if report_every:
+            tasks.append(asyncio.ensure_future(self.reporter(report_every)))
+        print("serving on " + (unix or "{}:{}".format(host, port)), flush=True)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+
+## Blocking client for a game process
+class InferenceClient():
+
+    def __init__(self, host="127.0.0.1", port=5005, unix=None):
+        if unix:
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.sock.connect(unix)
+        else:
+            self.sock = socket.create_connection((host, port))
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def decide(self, y, top_dist, bottom_dist):
+        ''' Returns True if the bird should jump. '''
+        self.sock.sendall(REQUEST.pack(y, top_dist, bottom_dist))
+        reply = self.sock.recv(REPLY.size)
+        if not reply:
+            raise ConnectionError("inference server closed the connection")
+        return bool(REPLY.unpack(reply)[0])
+
+    def close(self):
+        self.sock.close()
+
+
+# Define functions
+
+## Load generator: many concurrent clients
+async def load_client(host, port, unix, requests, latencies, seed):
+    if unix:
+        reader, writer = await asyncio.open_unix_connection(unix)
+    else:
+        reader, writer = await asyncio.open_connection(host, port)
+    rng = random.Random(seed)
+    for _ in range(requests):
+        obs = (rng.uniform(-10, 400), rng.uniform(0, 400), rng.uniform(0, 400))
+        start = time.perf_counter()
+        writer.write(REQUEST.pack(*obs))
+        await reader.readexactly(REPLY.size)
+        latencies.append(time.perf_counter() - start)
+    writer.close()
+
+
+async def generate_load(host="127.0.0.1", port=5005, unix=None, clients=64, requests=1000):
+    latencies = []
+    start = time.perf_counter()
+    await asyncio.gather(*(load_client(host, port, unix, requests, latencies, seed)
+                           for seed in range(clients)))
+    elapsed = time.perf_counter() - start
+    lat = np.array(latencies) * 1e3
+    print("{} clients x {} requests in {:.2f}s: {:.0f} req/s, round trip ms p50 {:.3f} p99 {:.3f}"
+          .format(clients, requests, elapsed, len(latencies) / elapsed,
+                  np.percentile(lat, 50), np.percentile(lat, 99)))
+
+
+## Command line
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("~~~")[1].strip().splitlines()[0])
+    parser.add_argument("mode", choices=["serve", "load"])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5005)
+    parser.add_argument("--unix", help="Unix socket path instead of TCP")
+    parser.add_argument("--champion", default="best_pickle")
+    parser.add_argument("--max-batch", type=int, default=256)
+    parser.add_argument("--max-delay", type=float, default=0.002, help="batching budget in seconds")
+    parser.add_argument("--report-every", type=float, default=5.0)
+    parser.add_argument("--clients", type=int, default=64)
+    parser.add_argument("--requests", type=int, default=1000, help="requests per client")
+    args = parser.parse_args()
+
+    if args.mode == "serve":
+        with open(args.champion, "rb") as f:
+            net = pickle.load(f)
+        if args.unix and os.path.exists(args.unix):
+            os.remove(args.unix)
+        server = InferenceServer(net, args.max_batch, args.max_delay)
+        try:
+            asyncio.run(server.serve(args.host, args.port, args.unix, args.report_every))
+        except KeyboardInterrupt:
+            pass
+    else:
+        asyncio.run(generate_load(args.host, args.port, args.unix, args.clients, args.requests))
+
+
+if __name__ == '__main__':
+    main()
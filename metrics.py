@@ -0,0 +1,160 @@
+'''
+metrics.py
+~~~
+Live metrics for a running evolution, served on localhost.
+
+MetricsReporter is a neat reporter that keeps the latest generation's
+numbers and serves them over HTTP in the Prometheus text format:
+
+    curl http://127.0.0.1:9100/metrics
+
+The reporter replaces one snapshot dict per generation, eval_genomes
+replaces its eval_stats dict every few frames, and the server thread only
+reads the current references, so there are no locks, a scrape never
+waits on eval_genomes and it shows the generation in progress.
+'''
+
+
+# Import libraries
+import os
+import statistics
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from neat.reporting import BaseReporter
+
+# Unix only; without it the peak memory falls back to the current one
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+# Define global constants
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+# Define functions
+
+## Memory of this process, in bytes
+def process_memory():
+    ''' Returns (resident, peak resident) bytes; 0 where unknown. '''
+    peak = 0
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024   # KiB on Linux
+    resident = 0
+    try:
+        with open("/proc/self/statm") as f:
+            resident = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        pass
+    return resident, max(peak, resident)
+
+
+## Render a snapshot in the Prometheus text format
+def render(snapshot):
+    lines = []
+
+    def metric(name, kind, help_text, samples):
+        lines.append("# HELP flappy_{} {}".format(name, help_text))
+        lines.append("# TYPE flappy_{} {}".format(name, kind))
+        for labels, value in samples:
+            lines.append("flappy_{}{} {!r}".format(name, labels, float(value)))
+
+    if "generation" in snapshot:
+        metric("generation", "gauge", "Last evaluated generation.",
+               [("", snapshot["generation"])])
+        metric("fitness_best", "gauge", "Best fitness of the last generation.",
+               [("", snapshot["best_fitness"])])
+        metric("fitness_mean", "gauge", "Mean fitness of the last generation.",
+               [("", snapshot["mean_fitness"])])
+        metric("species", "gauge", "Number of species.",
+               [("", snapshot["species"])])
+
+    evaluation = snapshot.get("eval")
+    if evaluation:
+        seconds = evaluation["seconds"]
+        metric("bird_frames_per_second", "gauge",
+               "Birds times frames simulated per second in the generation.",
+               [("", evaluation["bird_frames"] / seconds if seconds else 0)])
+        metric("eval_running", "gauge", "1 while the eval_* metrics are for a generation in progress.",
+               [("", evaluation["running"])])
+        metric("eval_frames", "gauge", "Frames simulated in the generation.",
+               [("", evaluation["frames"])])
+        metric("eval_seconds", "gauge", "Wall time of the eval_genomes call so far.",
+               [("", seconds)])
+        metric("eval_phase_seconds", "gauge", "Wall time per eval_genomes phase in the generation.",
+               [('{{phase="{}"}}'.format(phase), value)
+                for phase, value in sorted(evaluation["phases"].items())])
+
+    resident, peak = process_memory()
+    metric("process_resident_bytes", "gauge", "Resident memory of the process.",
+           [("", resident)])
+    metric("process_max_resident_bytes", "gauge", "Peak resident memory of the process.",
+           [("", peak)])
+    metric("uptime_seconds", "gauge", "Seconds since the reporter was created.",
+           [("", time.monotonic() - snapshot["started"])])
+
+    return "\n".join(lines) + "\n"
+
+
+# Create classes
+
+## neat reporter publishing metrics
+class MetricsReporter(BaseReporter):
+    ''' ``eval_stats`` is an optional callable returning the timings of
+    the current or last eval_genomes call (flappy_bird_NEAT.eval_stats);
+    it is called on every scrape. '''
+
+    def __init__(self, eval_stats=None):
+        self.eval_stats = eval_stats
+        self.snapshot = {"started": time.monotonic()}
+        self.generation = 0
+        self.server = None
+
+    def start_generation(self, generation):
+        self.generation = generation
+
+    def post_evaluate(self, config, population, species, best_genome):
+        fitnesses = [g.fitness for g in population.values()]
+        # Build a new dict and swap the reference; readers never see a partial update
+        self.snapshot = {"started": self.snapshot["started"],
+                         "generation": self.generation,
+                         "best_fitness": best_genome.fitness,
+                         "mean_fitness": statistics.mean(fitnesses),
+                         "species": len(species.species)}
+
+    def serve(self, port=9100, host="127.0.0.1"):
+        ''' Starts the HTTP server in a daemon thread. '''
+        reporter = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                snapshot = reporter.snapshot
+                if reporter.eval_stats is not None:
+                    snapshot = dict(snapshot, eval=reporter.eval_stats())
+                body = render(snapshot).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        thread.start()
+        return self.server
+
+    def shutdown(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
@@ -0,0 +1,150 @@
+'''
+netcompile.py
+~~~
+Compile a NEAT feed-forward network into a straight-line Python function.
+
+FeedForwardNetwork.activate walks its node list, looks every value up in
+a dict and calls the aggregation and activation functions per node.
+For a single bird that overhead dominates, so here each network is turned
+into generated source with the inputs, weights and tanh unrolled:
+
+    act = compile_network(pickle.load(open("best_pickle", "rb")))
+    output = act((bird.y, top_dist, bottom_dist))
+
+Compiled functions are cached by a structural hash of the network, for
+the ``CACHE_SIZE`` most recently used structures.
+compile_batch_network() emits the same code over numpy arrays, for
+evaluating many observations at once.
+'''
+
+
+# Import libraries
+import collections
+import math
+
+import neat
+import numpy as np
+from neat.activations import tanh_activation, sigmoid_activation
+from neat.aggregations import sum_aggregation
+
+
+# Cache of compiled functions, keyed by (batch, network structure), least
+# recently used first. Bounded, since every genome evaluated is a new network
+CACHE_SIZE = 1024
+_cache = collections.OrderedDict()
+
+
+# Define functions
+
+## Structural key of a network
+def network_key(net):
+    ''' Hashable description of everything that affects the outputs. '''
+    nodes = tuple(
+        (node, act_func, agg_func, bias, response, tuple(links))
+        for node, act_func, agg_func, bias, response, links in net.node_evals)
+    return (tuple(net.input_nodes), tuple(net.output_nodes), nodes)
+
+
+## Generate the source of the activate function
+def network_source(net, batch=False):
+    ''' Returns (source, namespace) for a function ``activate(inputs)``.
+
+    With ``batch`` the function takes one numpy array per input (or an
+    array of shape (n, n_inputs)) and returns one array per output. '''
+    names = {}
+    if batch:
+        namespace = {"tanh": np.tanh, "exp": np.exp, "clip": np.clip, "np": np}
+    else:
+        namespace = {"tanh": math.tanh, "exp": math.exp}
+    lines = ["def activate(inputs):"]
+
+    def var(key):
+        if key not in names:
+            names[key] = "v{}".format(len(names))
+        return names[key]
+
+    def clamp(expr, scale):
+        if batch:
+            return "clip({} * ({}), -60.0, 60.0)".format(scale, expr)
+        return "max(-60.0, min(60.0, {} * ({})))".format(scale, expr)
+
+    ### Unpack the inputs
+    n_inputs = len(net.input_nodes)
+    if batch:
+        lines.append("    inputs = np.asarray(inputs, dtype=float)")
+        lines.append("    if inputs.ndim == 2:")
+        lines.append("        inputs = inputs.T")
+        lines.append("    zero = np.zeros(inputs.shape[1:])")
+    lines.append("    if len(inputs) != {}:".format(n_inputs))
+    lines.append("        raise RuntimeError('Expected {} inputs, got {{}}'.format(len(inputs)))".format(n_inputs))
+    if n_inputs:
+        lines.append("    {}, = inputs".format(", ".join(var(k) for k in net.input_nodes)))
+    zero = "zero" if batch else "0.0"
+
+    ### One assignment per node, in evaluation order
+    for i, (node, act_func, agg_func, bias, response, links) in enumerate(net.node_evals):
+        terms = ["{} * {!r}".format(var(k), w) for k, w in links]
+        if agg_func is sum_aggregation:
+            s = "(" + " + ".join(terms) + ")" if terms else zero
+        elif batch:
+            namespace["agg{}".format(i)] = agg_func
+            s = "np.array([agg{}(col) for col in zip({})])".format(i, ", ".join(terms)) if terms else \
+                "np.full(zero.shape, agg{}([]))".format(i)
+        else:
+            namespace["agg{}".format(i)] = agg_func
+            s = "agg{}([{}])".format(i, ", ".join(terms))
+
+        z = "{!r} + {!r} * {}".format(bias, response, s)
+        if act_func is tanh_activation:
+            expr = "tanh({})".format(clamp(z, "2.5"))
+        elif act_func is sigmoid_activation:
+            expr = "1.0 / (1.0 + exp(-{}))".format(clamp(z, "5.0"))
+        elif batch:
+            namespace["act{}".format(i)] = np.vectorize(act_func, otypes=[float])
+            expr = "act{}({})".format(i, z)
+        else:
+            namespace["act{}".format(i)] = act_func
+            expr = "act{}({})".format(i, z)
+        lines.append("    {} = {}".format(var(node), expr))
+
+    ### Outputs that were never evaluated stay at 0.0, as in activate()
+    outputs = [names.get(k, zero) for k in net.output_nodes]
+    lines.append("    return [{}]".format(", ".join(outputs)))
+
+    return "\n".join(lines) + "\n", namespace
+
+
+## Compile a FeedForwardNetwork
+def compile_network(net, batch=False):
+    ''' Returns a function with the same results as ``net.activate``. '''
+    key = (batch, network_key(net))
+    func = _cache.get(key)
+    if func is None:
+        source, namespace = network_source(net, batch)
+        exec(compile(source, "<netcompile {:x}>".format(hash(key) & 0xffffffff), "exec"), namespace)
+        func = namespace["activate"]
+        func.source = source
+        _cache[key] = func
+        if len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    else:
+        _cache.move_to_end(key)
+    return func
+
+
+## Compile a FeedForwardNetwork for numpy batches
+def compile_batch_network(net):
+    ''' Returns ``activate(observations)`` taking an (n, n_inputs) array
+    and returning one length-n array per output. '''
+    return compile_network(net, batch=True)
+
+
+## Compile a genome directly
+def compile_genome(genome, config):
+    ''' Builds the genome's phenotype and compiles it. '''
+    return compile_network(neat.nn.FeedForwardNetwork.create(genome, config))
+
+
+## Empty the cache
+def clear_cache():
+    _cache.clear()
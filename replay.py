@@ -0,0 +1,207 @@
+'''
+replay.py
+~~~
+Re-watch a recorded generation of a flappy bird NEAT run.
+
+Record by setting ``flappy_bird_NEAT.RECORD_DIR = "logs"`` before
+``run()``, then:
+
+    python replay.py logs/gen_00012.json.gz --speed 4 --seek 1500
+
+The generation is re-simulated from its course seed and the logged jump
+frames using the game's own classes and update functions, so no networks
+are needed. State snapshots every ``snapshot_every`` frames make seeking
+cheap in long runs.
+'''
+
+
+# Import libraries
+import argparse
+import bisect
+
+import pygame
+
+import flappy_bird_NEAT as game
+from action_log import ActionLog
+
+
+# Create classes
+
+## Deterministic re-simulation of one generation
+class Replay():
+
+    def __init__(self, log, snapshot_every=300):
+        self.log = log
+        self.snapshot_every = snapshot_every
+        self.snapshots = {}
+        self.reset()
+
+    def reset(self):
+        ''' Back to frame 0. '''
+        for pipe in getattr(self, "pipes", []):
+            pipe.release()
+        game.course_rng.seed(self.log.seed)
+        self.birds = [game.Bird(game.WIN_WIDTH//4, game.WIN_HEIGHT//2)
+                      for _ in self.log.genome_ids]
+        self.alive = list(range(len(self.birds)))   # log index of each bird
+        self.base = game.Base(game.FLOOR)
+        self.pipes = [game.Pipe.spawn(game.WIN_WIDTH)]
+        self.score = 0
+        self.frame = 0
+        self.pipe_ind = 0
+        self.deaths = [None for _ in self.birds]
+        self.jump_sets = [set(frames) for frames in self.log.jumps]
+        self.take_snapshot()
+
+    @property
+    def done(self):
+        return not self.birds or self.frame >= self.log.frames
+
+    def remove_bird(self, bird, crashed):
+        i = self.birds.index(bird)
+        self.deaths[self.alive[i]] = self.frame
+        self.alive.pop(i)
+        self.birds.pop(i)
+
+    def step(self, animate=True):
+        ''' Advances one frame, exactly as eval_genomes does.
+
+        Pass ``animate=False`` when the frame is drawn with draw_window
+        afterwards, since drawing animates the birds itself. '''
+        if self.frame % self.snapshot_every == 0 and self.frame not in self.snapshots:
+            self.take_snapshot()
+
+        self.pipe_ind = game.pipe_index(self.birds, self.pipes)
+
+        for x, bird in enumerate(self.birds):
+            bird.move()
+            if self.frame in self.jump_sets[self.alive[x]]:
+                bird.jump()
+
+        self.base.move()
+
+        if game.move_pipes(self.birds, self.pipes, self.remove_bird):
+            self.score += 1
+            self.pipes.append(game.Pipe.spawn(game.WIN_WIDTH))
+
+        game.remove_offscreen(self.birds, self.remove_bird)
+
+        # draw_window animates the birds, which picks their collision masks
+        if animate:
+            for bird in self.birds:
+                bird.animate()
+
+        self.frame += 1
+
+    def take_snapshot(self):
+        self.snapshots[self.frame] = (
+            [tuple(getattr(b, s) for s in game.Bird.__slots__) for b in self.birds],
+            list(self.alive),
+            [tuple(getattr(p, s) for s in game.Pipe.__slots__) for p in self.pipes],
+            (self.base.x1, self.base.x2),
+            self.score, self.pipe_ind, list(self.deaths),
+            game.course_rng.getstate())
+
+    def restore(self, frame):
+        (birds, alive, pipes, base, self.score, self.pipe_ind, deaths,
+         rng_state) = self.snapshots[frame]
+        for pipe in self.pipes:
+            pipe.release()
+        self.birds = []
+        for values in birds:
+            bird = game.Bird(0, 0)
+            for slot, value in zip(game.Bird.__slots__, values):
+                setattr(bird, slot, value)
+            self.birds.append(bird)
+        self.pipes = []
+        for values in pipes:
+            pipe = game.Pipe.spawn(0)
+            for slot, value in zip(game.Pipe.__slots__, values):
+                setattr(pipe, slot, value)
+            self.pipes.append(pipe)
+        self.alive = list(alive)
+        self.base.x1, self.base.x2 = base
+        self.deaths = list(deaths)
+        game.course_rng.setstate(rng_state)
+        self.frame = frame
+
+    def seek(self, frame):
+        ''' Jumps to ``frame`` from the nearest snapshot at or before it. '''
+        frame = max(0, min(frame, self.log.frames))
+        known = sorted(self.snapshots)
+        start = known[bisect.bisect_right(known, frame) - 1]
+        if not (start <= self.frame <= frame):
+            self.restore(start)
+        while self.frame < frame and not self.done:
+            self.step()
+
+    def run_to_end(self):
+        while not self.done:
+            self.step()
+        return self.score
+
+    def verify(self):
+        ''' Replays the whole generation and checks it against the log. '''
+        self.reset()
+        self.run_to_end()
+        return self.score == self.log.score and self.deaths == self.log.deaths
+
+    def draw(self, win):
+        game.draw_window(win, self.birds, self.pipes, self.base, self.score,
+                         self.log.generation, self.pipe_ind)
+
+
+# Define functions
+
+## Watch a replay, drawing every ``speed``-th frame
+def watch(replay, speed=1, seek=0):
+    replay.seek(seek)
+    if game.renderer is not None:
+        game.renderer.reset()
+    clock = pygame.time.Clock()
+
+    paused = False
+    while not replay.done:
+        clock.tick(game.FPS)
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                return
+            if event.type == pygame.KEYDOWN:
+                if event.key == pygame.K_SPACE:
+                    paused = not paused
+                elif event.key == pygame.K_RIGHT:
+                    replay.seek(replay.frame + game.FPS * 10)
+                elif event.key == pygame.K_LEFT:
+                    replay.seek(replay.frame - game.FPS * 10)
+                elif event.key == pygame.K_UP:
+                    speed *= 2
+                elif event.key == pygame.K_DOWN:
+                    speed = max(1, speed // 2)
+                if game.renderer is not None:
+                    game.renderer.reset()
+
+        if paused:
+            continue
+        for k in range(speed):
+            if replay.done:
+                break
+            # The last frame is animated by drawing it
+            replay.step(animate=k < speed-1)
+        replay.draw(game.get_window())
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Replay a recorded generation.")
+    parser.add_argument("log", help="action log written with RECORD_DIR set")
+    parser.add_argument("--speed", type=int, default=1, help="frames simulated per drawn frame")
+    parser.add_argument("--seek", type=int, default=0, help="start at this frame")
+    parser.add_argument("--snapshot-every", type=int, default=300)
+    parser.add_argument("--verify", action="store_true",
+                        help="check the replay against the log instead of showing it")
+    args = parser.parse_args()
+
+    replay = Replay(ActionLog.load(args.log), args.snapshot_every)
+    if args.verify:
+        print("ok" if replay.verify() else "MISMATCH")
+    else:
+        watch(replay, args.speed, args.seek)
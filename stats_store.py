@@ -0,0 +1,131 @@
+'''
+stats_store.py
+~~~
+Append-only, disk-backed replacement for neat.StatisticsReporter.
+
+neat.StatisticsReporter keeps a deep copy of every generation's best
+genome and every fitness list in memory. DiskStatisticsReporter instead
+appends one JSON line of summary statistics per generation to
+``<directory>/stats.jsonl`` and pickles each champion onto
+``<directory>/champions.pkl``, keeping only the last ``history``
+generations in memory. visualize.plot_stats / plot_species read the
+store back line by line.
+'''
+
+
+# Import libraries
+import collections
+import json
+import os
+import pickle
+import statistics
+
+from neat.reporting import BaseReporter
+
+
+# Create classes
+
+## On-disk statistics store
+class StatsStore():
+
+    STATS_FILE = "stats.jsonl"
+    CHAMPIONS_FILE = "champions.pkl"
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.stats_path = os.path.join(directory, self.STATS_FILE)
+        self.champions_path = os.path.join(directory, self.CHAMPIONS_FILE)
+
+    def clear(self):
+        ''' Removes the files of a previous run. '''
+        for path in (self.stats_path, self.champions_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def append(self, row, champion=None):
+        ''' Appends one generation; the champion is pickled alongside. '''
+        os.makedirs(self.directory, exist_ok=True)
+        if champion is not None:
+            with open(self.champions_path, "ab") as f:
+                row["champion_offset"] = f.tell()
+                pickle.dump(champion, f, protocol=pickle.HIGHEST_PROTOCOL)
+        with open(self.stats_path, "a") as f:
+            f.write(json.dumps(row, separators=(",", ":")) + "\n")
+
+    def read_since(self, offset=0):
+        ''' Returns (rows, new_offset) for the generations appended after
+        byte ``offset``, so a reader can poll for new data. '''
+        if not os.path.exists(self.stats_path):
+            return [], offset
+        rows = []
+        with open(self.stats_path) as f:
+            f.seek(offset)
+            while True:
+                line = f.readline()
+                # Skip a line that is still being written
+                if not line.endswith("\n"):
+                    break
+                rows.append(json.loads(line))
+                offset = f.tell()
+        return rows, offset
+
+    def iter_generations(self):
+        ''' Yields one row per generation without loading the file. '''
+        if not os.path.exists(self.stats_path):
+            return
+        with open(self.stats_path) as f:
+            for line in f:
+                if line.endswith("\n"):
+                    yield json.loads(line)
+
+    def load_champion(self, row):
+        ''' Unpickles the champion stored with a generation row. '''
+        with open(self.champions_path, "rb") as f:
+            f.seek(row["champion_offset"])
+            return pickle.load(f)
+
+    def best_genome(self):
+        ''' The fittest champion over the whole run. '''
+        best = None
+        for row in self.iter_generations():
+            if "champion_offset" in row and (best is None or row["best_fitness"] > best["best_fitness"]):
+                best = row
+        return None if best is None else self.load_champion(best)
+
+
+## Reporter streaming to a StatsStore
+class DiskStatisticsReporter(BaseReporter):
+    ''' Records summary statistics and the champion of each generation
+    to disk, keeping the last ``history`` rows in ``recent``. Unless
+    ``resume`` is set, a previous run in the same directory is removed. '''
+
+    def __init__(self, directory="stats", history=100, save_champions=True, resume=False):
+        self.store = StatsStore(directory)
+        if not resume:
+            self.store.clear()
+        self.recent = collections.deque(maxlen=history)
+        self.save_champions = save_champions
+        self.generation = None
+
+    def start_generation(self, generation):
+        self.generation = generation
+
+    def post_evaluate(self, config, population, species, best_genome):
+        fitnesses = [g.fitness for g in population.values()]
+        row = {"generation": self.generation,
+               "best_fitness": best_genome.fitness,
+               "best_key": best_genome.key,
+               "mean_fitness": statistics.mean(fitnesses),
+               "stdev_fitness": statistics.pstdev(fitnesses),
+               "species_sizes": {str(sid): len(s.members) for sid, s in species.species.items()}}
+        self.store.append(row, best_genome if self.save_champions else None)
+        self.recent.append(row)
+
+    def get_fitness_mean(self):
+        return [row["mean_fitness"] for row in self.store.iter_generations()]
+
+    def get_fitness_stdev(self):
+        return [row["stdev_fitness"] for row in self.store.iter_generations()]
+
+    def best_genome(self):
+        return self.store.best_genome()
@@ -0,0 +1,354 @@
+'''
+sweep.py
+~~~
+Hyperparameter sweeps over config-feedforward.txt.
+
+Expands a grid (or a random sample) of config overrides, runs each
+variant headless through flappy_bird_NEAT.run in a shared process pool
+with its own seed, time budget and memory budget, and collects the
+outcomes into one table:
+
+    python sweep.py --grid pop_size=10,20,40 --grid compatibility_threshold=2.0,3.0 \\
+                    --seeds 0 1 --generations 20 --processes 4
+    python sweep.py --random 12 --range weight_mutate_rate=0.4:0.9 --range pop_size=10:50
+
+Parameters are given by name, or as ``Section.name`` when the name is
+not unique. Each run lives in ``<out>/runs/<key>/`` and its result is
+appended to ``<out>/results.jsonl``. Runs already stored there are
+skipped, so an interrupted sweep can simply be started again; runs that
+failed with an error are only run again with ``--retry-failed``.
+'''
+
+
+# Import libraries
+import argparse
+import configparser
+import csv
+import hashlib
+import itertools
+import json
+import multiprocessing
+import os
+import queue
+import random
+import sys
+import time
+import traceback
+
+from neat.reporting import BaseReporter
+
+# Unix only; --memory-mb needs it
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+# Define global constants
+LOCAL_DIR = os.path.dirname(os.path.abspath(__file__))
+BASE_CONFIG = os.path.join(LOCAL_DIR, "config-feedforward.txt")
+RESULT_COLUMNS = ["key", "seed", "status", "generations", "best_fitness",
+                  "seconds", "max_rss_mb"]
+
+
+# Create classes
+
+## Stops a run once its time budget is spent
+class BudgetExceeded(Exception):
+    pass
+
+
+class TimeBudgetReporter(BaseReporter):
+    ''' Checked between generations and, through
+    flappy_bird_NEAT.FRAME_HOOK, on every frame of a generation. '''
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.deadline = time.monotonic() + seconds
+
+    def check(self):
+        if time.monotonic() > self.deadline:
+            raise BudgetExceeded("time budget of {}s exceeded".format(self.seconds))
+
+    def start_generation(self, generation):
+        self.check()
+
+
+# Define functions
+
+## Read the base config
+def read_config(path=BASE_CONFIG):
+    parser = configparser.ConfigParser()
+    parser.optionxform = str
+    with open(path) as f:
+        parser.read_file(f)
+    return parser
+
+
+## Find the section of a parameter
+def resolve(parser, name):
+    ''' Returns (section, option) for ``name`` or ``Section.name``. '''
+    if "." in name:
+        section, option = name.split(".", 1)
+        if not parser.has_option(section, option):
+            raise ValueError("No parameter {!r} in section [{}]".format(option, section))
+        return section, option
+    sections = [s for s in parser.sections() if parser.has_option(s, name)]
+    if not sections:
+        raise ValueError("No parameter {!r} in the config".format(name))
+    if len(sections) > 1:
+        raise ValueError("Parameter {!r} is in {}; use Section.{}".format(name, sections, name))
+    return sections[0], name
+
+
+## Parse "1,2,3" / "0.1:0.9" values
+def parse_value(text):
+    for kind in (int, float):
+        try:
+            return kind(text)
+        except ValueError:
+            pass
+    return text
+
+
+def grid_variants(grid):
+    ''' Every combination of ``{name: [values]}``. '''
+    names = sorted(grid)
+    for values in itertools.product(*(grid[n] for n in names)):
+        yield dict(zip(names, values))
+
+
+def random_variants(ranges, n, seed=0):
+    ''' ``n`` samples of ``{name: (low, high)}``; ints stay ints. '''
+    rng = random.Random(seed)
+    for _ in range(n):
+        variant = {}
+        for name in sorted(ranges):
+            low, high = ranges[name]
+            if isinstance(low, int) and isinstance(high, int):
+                variant[name] = rng.randint(low, high)
+            else:
+                variant[name] = round(rng.uniform(low, high), 6)
+        yield variant
+
+
+## Identify a run by everything that affects its result
+def run_key(base_text, overrides, seed, generations):
+    payload = json.dumps([base_text, sorted(overrides.items()), seed, generations])
+    return hashlib.sha1(payload.encode()).hexdigest()[:12]
+
+
+## Write a variant of the base config
+def write_variant(parser, overrides, path):
+    variant = configparser.ConfigParser()
+    variant.optionxform = str
+    variant.read_dict(parser)
+    for name, value in overrides.items():
+        section, option = resolve(variant, name)
+        variant.set(section, option, str(value))
+    with open(path, "w") as f:
+        variant.write(f)
+
+
+## One run, inside a pool worker
+def run_variant(job):
+    key, run_dir, config_path, seed, generations, time_budget, memory_mb = job
+    result = {"key": key, "seed": seed, "status": "ok", "generations": 0,
+              "best_fitness": None, "seconds": 0.0, "max_rss_mb": None,
+              "time_budget": time_budget, "memory_mb": memory_mb}
+    start = time.monotonic()
+
+    if memory_mb:
+        limit = memory_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+    os.environ["SDL_VIDEODRIVER"] = "dummy"
+    log = open(os.path.join(run_dir, "run.log"), "w")
+    sys.stdout = sys.stderr = log
+    try:
+        # The game loads its images relative to the repository root
+        os.chdir(LOCAL_DIR)
+        import flappy_bird_NEAT as game
+        os.chdir(run_dir)
+        game.FPS = 0
+        game.DRAW = False
+        game.STATS_DIR = os.path.join(run_dir, "stats")
+
+        random.seed(seed)
+        reporters = []
+        if time_budget:
+            budget = TimeBudgetReporter(time_budget)
+            game.FRAME_HOOK = budget.check
+            reporters.append(budget)
+        game.run(config_path, generations, reporters)
+    except BudgetExceeded:
+        result["status"] = "time budget"
+    except MemoryError:
+        result["status"] = "memory budget"
+    except Exception:
+        traceback.print_exc()
+        result["status"] = "error"
+    finally:
+        log.flush()
+
+    ### Collect what was recorded, even for runs cut short
+    from stats_store import StatsStore
+    for row in StatsStore(os.path.join(run_dir, "stats")).iter_generations():
+        result["generations"] += 1
+        if result["best_fitness"] is None or row["best_fitness"] > result["best_fitness"]:
+            result["best_fitness"] = row["best_fitness"]
+    result["seconds"] = round(time.monotonic() - start, 3)
+    if resource is not None:
+        result["max_rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    return result
+
+
+## Results already stored
+def load_results(path):
+    results = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            for line in f:
+                if line.endswith("\n"):
+                    row = json.loads(line)
+                    results[row["key"]] = row
+    return results
+
+
+## Whether a stored result can stand in for running again
+def is_stored(row, time_budget, memory_mb, retry_failed=False):
+    if row is None:
+        return False
+    if row["status"] == "ok":
+        return True
+    if row["status"] == "time budget":
+        return row.get("time_budget") == time_budget
+    if row["status"] == "memory budget":
+        return row.get("memory_mb") == memory_mb
+    return not retry_failed
+
+
+## Run a sweep
+def sweep(variants, seeds=(0,), generations=50, out="sweep", processes=None,
+          time_budget=None, memory_mb=None, base_config=BASE_CONFIG, retry_failed=False):
+    ''' Runs every variant for every seed and returns the result rows.
+
+    Stored runs are skipped: budget-limited ones only while the budget
+    is unchanged, and errors unless ``retry_failed`` is set. '''
+    if memory_mb and resource is None:
+        raise ValueError("memory budgets need the Unix-only resource module")
+    parser = read_config(base_config)
+    with open(base_config) as f:
+        base_text = f.read()
+    os.makedirs(os.path.join(out, "runs"), exist_ok=True)
+    results_path = os.path.join(out, "results.jsonl")
+    done = load_results(results_path)
+
+    ### Build the jobs, skipping runs already stored
+    jobs = []
+    params = {}
+    for overrides in variants:
+        # "name" and "Section.name" are the same run
+        overrides = {"{}.{}".format(*resolve(parser, name)): value
+                     for name, value in overrides.items()}
+        for seed in seeds:
+            key = run_key(base_text, overrides, seed, generations)
+            # Duplicate samples and stored runs are not run again
+            if key in params or is_stored(done.get(key), time_budget, memory_mb, retry_failed):
+                params[key] = overrides
+                continue
+            params[key] = overrides
+            run_dir = os.path.abspath(os.path.join(out, "runs", key))
+            os.makedirs(run_dir, exist_ok=True)
+            config_path = os.path.join(run_dir, "config.txt")
+            write_variant(parser, overrides, config_path)
+            jobs.append((key, run_dir, config_path, seed, generations, time_budget, memory_mb))
+    print("{} runs, {} already stored".format(len(params), len(params) - len(jobs)))
+
+    ### Fresh worker per run: the game keeps module-level state
+    finished = queue.Queue()
+
+    def failed(job):
+        # run_variant itself raised, e.g. setting the memory limit
+        return lambda e: finished.put({"key": job[0], "seed": job[3],
+                                       "status": "failed: {}".format(e)})
+
+    with multiprocessing.Pool(processes, maxtasksperchild=1) as pool, \
+         open(results_path, "a") as results_file:
+        for job in jobs:
+            pool.apply_async(run_variant, (job,), callback=finished.put, error_callback=failed(job))
+        for _ in jobs:
+            result = finished.get()
+            result["params"] = params[result["key"]]
+            results_file.write(json.dumps(result) + "\n")
+            results_file.flush()
+            done[result["key"]] = result
+            fields = dict.fromkeys(RESULT_COLUMNS)
+            fields.update(result)
+            print("{key} {status} best={best_fitness} gens={generations} {seconds}s".format(**fields))
+
+    rows = [done[key] for key in params]
+    write_table(rows, os.path.join(out, "results.csv"))
+    return rows
+
+
+## One table of parameters and outcomes
+def write_table(rows, path):
+    names = sorted({name for row in rows for name in row.get("params", {})})
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(names + RESULT_COLUMNS)
+        for row in rows:
+            writer.writerow([row.get("params", {}).get(n) for n in names] +
+                            [row.get(c) for c in RESULT_COLUMNS])
+
+
+## Command line
+def main():
+    parser = argparse.ArgumentParser(description="Hyperparameter sweep over config-feedforward.txt.")
+    parser.add_argument("--grid", action="append", default=[], metavar="NAME=V1,V2",
+                        help="values for a grid search (repeatable)")
+    parser.add_argument("--random", type=int, metavar="N", help="sample N variants from --range")
+    parser.add_argument("--range", action="append", default=[], metavar="NAME=LOW:HIGH",
+                        help="range for random search (repeatable)")
+    parser.add_argument("--seeds", type=int, nargs="+", default=[0])
+    parser.add_argument("--generations", type=int, default=50)
+    parser.add_argument("--processes", type=int)
+    parser.add_argument("--time-budget", type=float, help="seconds per run")
+    parser.add_argument("--memory-mb", type=int, help="address space limit per run")
+    parser.add_argument("--config", default=BASE_CONFIG)
+    parser.add_argument("--out", default="sweep")
+    parser.add_argument("--retry-failed", action="store_true",
+                        help="run stored runs that ended in an error again")
+    args = parser.parse_args()
+    if args.memory_mb and resource is None:
+        parser.error("--memory-mb is not supported on this platform")
+
+    if args.random:
+        ranges = {}
+        for spec in args.range:
+            name, bounds = spec.split("=", 1)
+            low, high = bounds.split(":")
+            ranges[name] = (parse_value(low), parse_value(high))
+        variants = list(random_variants(ranges, args.random))
+    else:
+        grid = {}
+        for spec in args.grid:
+            name, values = spec.split("=", 1)
+            grid[name] = [parse_value(v) for v in values.split(",")]
+        variants = list(grid_variants(grid))
+
+    ### Fail early on unknown parameters
+    base = read_config(args.config)
+    for variant in variants:
+        for name in variant:
+            resolve(base, name)
+
+    rows = sweep(variants, args.seeds, args.generations, args.out, args.processes,
+                 args.time_budget, args.memory_mb, args.config, args.retry_failed)
+    print("results: " + os.path.join(args.out, "results.csv"))
+    return rows
+
+
+if __name__ == '__main__':
+    main()
@@ -1,12 +1,47 @@
 from __future__ import print_function
 
+import collections
+import concurrent.futures
 import copy
+import hashlib
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
 import warnings
 
 import graphviz
 import matplotlib.pyplot as plt
 import numpy as np
 
+from stats_store import StatsStore
+
+
+def _stats_store(statistics):
+    """ Returns the StatsStore behind a DiskStatisticsReporter, a store itself or None. """
+    if isinstance(statistics, StatsStore):
+        return statistics
+    return getattr(statistics, 'store', None)
+
+
+def read_fitness(store):
+    """ Reads best, mean and stdev fitness per generation from a StatsStore, one line at a time. """
+    best_fitness, avg_fitness, stdev_fitness = [], [], []
+    for row in store.iter_generations():
+        best_fitness.append(row['best_fitness'])
+        avg_fitness.append(row['mean_fitness'])
+        stdev_fitness.append(row['stdev_fitness'])
+    return best_fitness, np.array(avg_fitness), np.array(stdev_fitness)
+
+
+def read_species_sizes(store):
+    """ Reads species sizes per generation from a StatsStore, in the layout of get_species_sizes. """
+    rows = [{int(sid): size for sid, size in row['species_sizes'].items()}
+            for row in store.iter_generations()]
+    all_species = sorted(set().union(*rows)) if rows else []
+    return [[sizes.get(sid, 0) for sid in all_species] for sizes in rows]
+
 
 def plot_stats(statistics, ylog=False, view=False, filename='avg_fitness.svg'):
     """ Plots the population's average and best fitness. """
@@ -14,10 +49,14 @@ def plot_stats(statistics, ylog=False, view=False, filename='avg_fitness.svg'):
         warnings.warn("This display is not available due to a missing optional dependency (matplotlib)")
         return
 
-    generation = range(len(statistics.most_fit_genomes))
-    best_fitness = [c.fitness for c in statistics.most_fit_genomes]
-    avg_fitness = np.array(statistics.get_fitness_mean())
-    stdev_fitness = np.array(statistics.get_fitness_stdev())
+    store = _stats_store(statistics)
+    if store is not None:
+        best_fitness, avg_fitness, stdev_fitness = read_fitness(store)
+    else:
+        best_fitness = [c.fitness for c in statistics.most_fit_genomes]
+        avg_fitness = np.array(statistics.get_fitness_mean())
+        stdev_fitness = np.array(statistics.get_fitness_stdev())
+    generation = range(len(best_fitness))
 
     plt.plot(generation, avg_fitness, 'b-', label="average")
     plt.plot(generation, avg_fitness - stdev_fitness, 'g-.', label="-1 sd")
@@ -94,7 +133,11 @@ def plot_species(statistics, view=False, filename='speciation.svg'):
         warnings.warn("This display is not available due to a missing optional dependency (matplotlib)")
         return
 
-    species_sizes = statistics.get_species_sizes()
+    store = _stats_store(statistics)
+    if store is not None:
+        species_sizes = read_species_sizes(store)
+    else:
+        species_sizes = statistics.get_species_sizes()
     num_generations = len(species_sizes)
     curves = np.array(species_sizes).T
 
@@ -113,14 +156,234 @@ def plot_species(statistics, view=False, filename='speciation.svg'):
     plt.close()
 
 
+class LivePlot(object):
+    """ Fitness and speciation plots that grow as a StatsStore is appended to.
+
+    New generations are appended to the existing line artists instead of
+    rebuilding the figure, and the figure is redrawn (and saved, if
+    ``filename`` is given) at most once every ``interval`` seconds. Use
+    start() to poll the store from a background process so plotting never
+    blocks the evolution loop. """
+
+    def __init__(self, store, filename=None, view=True, interval=1.0):
+        self.store = store if isinstance(store, StatsStore) else StatsStore(store)
+        self.filename = filename
+        self.view = view
+        self.interval = interval
+        self.offset = 0
+        self.last_draw = None
+        self.dirty = False
+        self.fig = None
+        self.process = None
+        self.stop_event = None
+
+    def _setup(self):
+        self.fig, (self.ax_fitness, self.ax_species) = plt.subplots(2, 1, figsize=(8, 8))
+        self.data = {'generation': [], 'best': [], 'average': [], 'lower': [], 'upper': []}
+        self.lines = {
+            'average': self.ax_fitness.plot([], [], 'b-', label="average")[0],
+            'lower': self.ax_fitness.plot([], [], 'g-.', label="-1 sd")[0],
+            'upper': self.ax_fitness.plot([], [], 'g-.', label="+1 sd")[0],
+            'best': self.ax_fitness.plot([], [], 'r-', label="best")[0]}
+        self.ax_fitness.set_title("Population's average and best fitness")
+        self.ax_fitness.set_xlabel("Generations")
+        self.ax_fitness.set_ylabel("Fitness")
+        self.ax_fitness.grid()
+        self.ax_fitness.legend(loc="best")
+
+        # One line per species boundary; sizes are stacked in species order
+        self.species_order = []
+        self.species_sizes = []
+        self.species_lines = {}
+        self.ax_species.set_title("Speciation")
+        self.ax_species.set_ylabel("Size per Species")
+        self.ax_species.set_xlabel("Generations")
+
+        if self.view:
+            plt.ion()
+            plt.show(block=False)
+
+    def update(self):
+        """ Appends generations written since the last call; returns how many. """
+        if self.fig is None:
+            self._setup()
+
+        rows, self.offset = self.store.read_since(self.offset)
+        for row in rows:
+            d = self.data
+            d['generation'].append(len(d['generation']))
+            d['best'].append(row['best_fitness'])
+            d['average'].append(row['mean_fitness'])
+            d['lower'].append(row['mean_fitness'] - row['stdev_fitness'])
+            d['upper'].append(row['mean_fitness'] + row['stdev_fitness'])
+
+            sizes = {int(sid): size for sid, size in row['species_sizes'].items()}
+            for sid in sorted(sizes):
+                if sid not in self.species_lines:
+                    self.species_order.append(sid)
+                    # New species start at zero in earlier generations
+                    self.species_sizes.append([0] * (len(d['generation']) - 1))
+                    self.species_lines[sid] = self.ax_species.plot([], [], '-', linewidth=1)[0]
+            for sid, column in zip(self.species_order, self.species_sizes):
+                column.append(sizes.get(sid, 0))
+
+        if rows:
+            for name, line in self.lines.items():
+                line.set_data(self.data['generation'], self.data[name])
+            top = np.zeros(len(self.data['generation']))
+            for sid, column in zip(self.species_order, self.species_sizes):
+                top = top + column
+                self.species_lines[sid].set_data(self.data['generation'], top)
+            self.draw()
+
+        return len(rows)
+
+    def draw(self, force=False):
+        """ Redraws the figure unless it was redrawn within ``interval`` seconds.
+
+        A skipped redraw leaves the plot dirty; run() draws it once the
+        interval has passed, even if no new generation arrives. """
+        now = time.monotonic()
+        if not force and self.last_draw is not None and now - self.last_draw < self.interval:
+            self.dirty = True
+            return
+        self.last_draw = now
+        self.dirty = False
+        for ax in (self.ax_fitness, self.ax_species):
+            ax.relim()
+            ax.autoscale_view()
+        if self.view:
+            self.fig.canvas.draw_idle()
+            self.fig.canvas.flush_events()
+        if self.filename is not None:
+            self.fig.savefig(self.filename)
+
+    def run(self, stop_event=None, poll=0.5):
+        """ Polls the store until ``stop_event`` is set. """
+        while stop_event is None or not stop_event.is_set():
+            if not self.update():
+                if self.dirty:
+                    self.draw()
+                if self.view:
+                    plt.pause(poll)
+                else:
+                    time.sleep(poll)
+        self.update()
+        self.draw(force=True)
+        plt.close(self.fig)
+
+    def start(self):
+        """ Runs the plot in a background process. """
+        self.stop_event = multiprocessing.Event()
+        self.process = multiprocessing.Process(target=self.run, args=(self.stop_event,), daemon=True)
+        self.process.start()
+        return self
+
+    def stop(self, timeout=10.0):
+        """ Stops the background process after a final redraw. """
+        if self.process is not None:
+            self.stop_event.set()
+            self.process.join(timeout)
+            self.process = None
+
+
+# Rendered networks live in NET_CACHE_DIR as <net_key>.<fmt>; their sources are kept here by key
+NET_CACHE_DIR = os.path.join(tempfile.gettempdir(), 'draw_net_cache')
+_net_cache = {}
+
+
+def net_key(config, genome, node_names=None, show_disabled=True, prune_unused=False, node_colors=None, fmt='svg'):
+    """ Hash of everything draw_net's output depends on. """
+    parts = (tuple(config.genome_config.input_keys),
+             tuple(config.genome_config.output_keys),
+             tuple(sorted(genome.nodes.keys())),
+             tuple(sorted((cg.key, cg.weight, cg.enabled) for cg in genome.connections.values())),
+             tuple(sorted((node_names or {}).items())),
+             tuple(sorted((node_colors or {}).items())),
+             show_disabled, prune_unused, fmt)
+    return hashlib.sha1(repr(parts).encode()).hexdigest()
+
+
 def draw_net(config, genome, view=False, filename=None, node_names=None, show_disabled=True, prune_unused=False,
              node_colors=None, fmt='svg'):
-    """ Receives a genome and draws a neural network with arbitrary topology. """
-    # Attributes for network nodes.
+    """ Receives a genome and draws a neural network with arbitrary topology.
+
+    Renders are cached in NET_CACHE_DIR by net_key and copied to
+    ``filename``, so genomes that draw the same as one rendered before do
+    not run graphviz again. Returns the Digraph, or a graphviz.Source of
+    the cached drawing on a cache hit. """
     if graphviz is None:
         warnings.warn("This display is not available due to a missing optional dependency (graphviz)")
         return
 
+    key = net_key(config, genome, node_names, show_disabled, prune_unused, node_colors, fmt)
+    source = _net_cache.get(key)
+    if source is None:
+        dot = build_net(config, genome, node_names, show_disabled, prune_unused, node_colors, fmt)
+        source = _net_cache[key] = dot.source
+    else:
+        dot = graphviz.Source(source, format=fmt)
+
+    path = _render_cached(key, source, fmt)
+    target = (filename if filename is not None else 'Digraph.gv') + '.' + fmt
+    shutil.copyfile(path, target)
+    if view:
+        graphviz.view(target)
+
+    return dot
+
+
+def _render_cached(key, source, fmt):
+    """ Returns the cached render of ``source``, rendering it if the cache file is missing or stale. """
+    os.makedirs(NET_CACHE_DIR, exist_ok=True)
+    source_path = os.path.join(NET_CACHE_DIR, key)
+    path = source_path + '.' + fmt
+    if os.path.exists(path) and os.path.exists(source_path):
+        with open(source_path) as f:
+            if f.read() == source:
+                return path
+    return graphviz.Source(source, format=fmt).render(key, directory=NET_CACHE_DIR)
+
+
+def _render_net_worker(args):
+    config, genome, kwargs = args
+    key = net_key(config, genome, **kwargs)
+    dot = build_net(config, genome, **kwargs)
+    _render_cached(key, dot.source, kwargs.get('fmt', 'svg'))
+    return key, dot.source
+
+
+def draw_nets(config, genomes, filenames, processes=None, **kwargs):
+    """ Renders many genomes in a process pool; takes draw_net's keyword arguments except ``view``.
+
+    Genomes with the same structure are rendered once. The renders are
+    added to this process's cache, so later draw_net calls reuse them. """
+    fmt = kwargs.get('fmt', 'svg')
+    genomes = list(genomes)
+    jobs = collections.OrderedDict()
+    for genome in genomes:
+        key = net_key(config, genome, **kwargs)
+        if key not in _net_cache and key not in jobs:
+            jobs[key] = (config, genome, kwargs)
+
+    if processes == 1 or len(jobs) <= 1:
+        results = [_render_net_worker(job) for job in jobs.values()]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(processes) as pool:
+            results = list(pool.map(_render_net_worker, jobs.values()))
+    for key, source in results:
+        _net_cache[key] = source
+
+    # Every genome is now a cache hit; this only copies files
+    for genome, filename in zip(genomes, filenames):
+        draw_net(config, genome, filename=filename, **kwargs)
+
+    return [filename + '.' + fmt for filename in filenames]
+
+
+def build_net(config, genome, node_names=None, show_disabled=True, prune_unused=False, node_colors=None, fmt='svg'):
+    """ Builds the graphviz Digraph drawn by draw_net, without rendering it. """
+    # Attributes for network nodes.
     if node_names is None:
         node_names = {}
 
@@ -155,20 +418,21 @@ def draw_net(config, genome, view=False, filename=None, node_names=None, show_di
         dot.node(name, _attributes=node_attrs)
 
     if prune_unused:
-        connections = set()
+        # Walk back from the outputs once over a reverse adjacency list
+        sources = collections.defaultdict(list)
         for cg in genome.connections.values():
             if cg.enabled or show_disabled:
-                connections.add((cg.in_node_id, cg.out_node_id))
+                a, b = cg.key
+                sources[b].append(a)
 
         used_nodes = copy.copy(outputs)
-        pending = copy.copy(outputs)
+        pending = list(outputs)
         while pending:
-            new_pending = set()
-            for a, b in connections:
-                if b in pending and a not in used_nodes:
-                    new_pending.add(a)
+            b = pending.pop()
+            for a in sources.get(b, ()):
+                if a not in used_nodes:
                     used_nodes.add(a)
-            pending = new_pending
+                    pending.append(a)
     else:
         used_nodes = set(genome.nodes.keys())
 
@@ -192,6 +456,4 @@ def draw_net(config, genome, view=False, filename=None, node_names=None, show_di
             width = str(0.1 + abs(cg.weight / 5.0))
             dot.edge(a, b, _attributes={'style': style, 'color': color, 'penwidth': width})
 
-    dot.render(filename, view=view)
-
     return dot